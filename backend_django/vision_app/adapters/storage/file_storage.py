@@ -1,13 +1,12 @@
 from __future__ import annotations
 
-import io
 import os
 import uuid
 from datetime import datetime
 from typing import Optional
 
+import cv2
 import numpy as np
-from PIL import Image
 from django.conf import settings
 
 from ...application.ports.storage import FileStorage
@@ -31,17 +30,16 @@ class MediaFileStorage(FileStorage):
 			abs_dir = os.path.join(media_root, rel_dir)
 			os.makedirs(abs_dir, exist_ok=True)
 
-			# Encode as JPEG
-			img = Image.fromarray(image_rgb.astype(np.uint8))
-			buf = io.BytesIO()
-			img.save(buf, format='JPEG', quality=90)
-			buf.seek(0)
+			# Encode as JPEG (OpenCV expects BGR)
+			ok, jpg = cv2.imencode('.jpg', cv2.cvtColor(image_rgb.astype(np.uint8, copy=False), cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 90])
+			if not ok:
+				return None
 
 			name = f"{uuid.uuid4().hex}.jpg"
 			rel_path = os.path.join(rel_dir, name).replace('\\', '/')
 			abs_path = os.path.join(abs_dir, name)
 			with open(abs_path, 'wb') as f:
-				f.write(buf.read())
+				f.write(jpg.tobytes())
 
 			# Build absolute-ish URL (best-effort)
 			base = str(media_url or '/media/')
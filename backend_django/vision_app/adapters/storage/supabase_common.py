@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import os
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Tuple
 
 
 def create_supabase_client():
@@ -21,6 +22,21 @@ def create_supabase_client():
 	return create_client(url, key)
 
 
+@lru_cache(maxsize=1)
+def get_supabase_client():
+	"""Process-wide Supabase client, so its HTTP connection pool stays warm across requests.
+
+	Built on first use; failures are not cached, so a later call retries.
+	"""
+	return create_supabase_client()
+
+
+@lru_cache(maxsize=1)
+def get_previews_supabase() -> Tuple[object, str]:
+	"""Process-wide ``(client, bucket)`` pair for the processed-previews bucket."""
+	return get_supabase_client(), os.getenv('VC_PREVIEWS_BUCKET', 'eye-previews')
+
+
 def get_public_url(client, bucket: str, path: str) -> Optional[str]:
 	"""Best-effort to build a public URL for an object."""
 	try:
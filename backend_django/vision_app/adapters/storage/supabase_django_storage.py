@@ -7,7 +7,7 @@ from typing import Optional
 from django.core.files.storage import Storage
 from django.core.files.base import ContentFile, File
 
-from .supabase_common import create_supabase_client, get_public_url, create_signed_url
+from .supabase_common import get_supabase_client, get_public_url, create_signed_url
 
 # Simple in-process cache for signed URLs to avoid generating them on every request
 _signed_url_cache: dict[str, tuple[str, float]] = {}
@@ -26,7 +26,7 @@ class SupabaseDjangoStorage(Storage):
 
 	def _client(self):
 		if self.client is None:
-			self.client = create_supabase_client()
+			self.client = get_supabase_client()
 		return self.client
 
 	def _save(self, name: str, content: File) -> str:  # type: ignore[override]
@@ -93,6 +93,16 @@ class SupabaseDjangoStorage(Storage):
 		except Exception:
 			pass
 
+	def delete_many(self, names) -> None:
+		"""Remove several objects with a single Storage API call."""
+		paths = [n.replace('\\', '/') for n in names if n]
+		if not paths:
+			return
+		try:
+			self._client().storage.from_(self.bucket).remove(paths)
+		except Exception:
+			pass
+
 	def size(self, name: str) -> int:  # type: ignore[override]
 		return 0
 
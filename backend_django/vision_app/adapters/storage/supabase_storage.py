@@ -1,15 +1,14 @@
 from __future__ import annotations
 
-import io
 import os
 import uuid
 from datetime import datetime
 from typing import Optional
 
+import cv2
 import numpy as np
-from PIL import Image
 
-from .supabase_common import create_supabase_client, get_public_url
+from .supabase_common import get_supabase_client, get_public_url
 from ...application.ports.storage import FileStorage
 
 
@@ -25,17 +24,16 @@ class SupabaseFileStorage(FileStorage):
 
 	def save_processed_preview(self, image_rgb: np.ndarray) -> Optional[str]:
 		try:
-			client = create_supabase_client()
-			# Encode image to JPEG
-			img = Image.fromarray(image_rgb.astype(np.uint8))
-			buf = io.BytesIO()
-			img.save(buf, format='JPEG', quality=90)
-			buf.seek(0)
+			client = get_supabase_client()
+			# Encode image to JPEG (OpenCV expects BGR)
+			ok, jpg = cv2.imencode('.jpg', cv2.cvtColor(image_rgb.astype(np.uint8, copy=False), cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 90])
+			if not ok:
+				return None
 			now = datetime.utcnow()
 			path = f"processed/{now.year:04d}/{now.month:02d}/{uuid.uuid4().hex}.jpg"
 			# Nota: algunas versiones de supabase-py/httpx esperan headers stringificados;
 			# usar 'upsert': 'false' evita errores del tipo "'bool' object has no attribute 'encode'".
-			client.storage.from_(self.bucket).upload(path, buf.getvalue(), {
+			client.storage.from_(self.bucket).upload(path, jpg.tobytes(), {
 				'contentType': 'image/jpeg',
 				'upsert': 'false',
 			})
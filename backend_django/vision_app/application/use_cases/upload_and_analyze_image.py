@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
+import io
 import os
 import time
+import cv2
 import numpy as np
 from PIL import Image
 
@@ -12,17 +15,25 @@ from ..ports.storage import FileStorage
 from ..ports.ai_services import EyeDiseaseDetector
 from ...domain.image_processing import (
     enhance_image_quality,
-    detect_eye_region,
+    detect_eye_region_with_gray,
     compute_image_quality,
     analyze_eye_features,
+    limit_image_size,
 )
 from ...domain.diagnosis import rule_based_diagnosis
 
 
+def _env_float(env: str, default: float) -> float:
+    try:
+        return float(os.getenv(env, str(default)))
+    except Exception:
+        return default
+
+
 @dataclass
 class UploadAndAnalyzeInput:
     user_id: int
-    image_file: Any  # file-like object readable by PIL
+    image_file: Any  # file-like object holding an encoded image (JPEG/PNG/WEBP/...)
     enable_tta: bool = True
     enable_quality: bool = True
     p_high: float = 0.75
@@ -43,22 +54,25 @@ class UploadAndAnalyzeImage:
     def execute(self, inp: UploadAndAnalyzeInput) -> Dict[str, Any]:
         start_time = time.time()
 
-        # Load image with PIL and get RGB numpy array
-        pil_image = Image.open(inp.image_file)
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        image_array = np.array(pil_image)
+        image_array = limit_image_size(_decode_rgb(inp.image_file))
 
         # Enhance and crop
         enhanced = enhance_image_quality(image_array)
-        eye_region = detect_eye_region(enhanced)
-
-        # Optional preview storage
-        preview_url = self.storage.save_processed_preview(eye_region)
+        eye_region, eye_gray = detect_eye_region_with_gray(enhanced)
+
+        # Optional preview storage: upload in the background while metrics and
+        # inference run, and collect the URL before persisting the record. The
+        # executor is per request so concurrent requests never queue behind each
+        # other's uploads.
+        # The stored preview is display-only, so it is capped to VC_PREVIEW_MAX_EDGE px
+        # (0 = full ROI); the metrics below still see the full-resolution ROI.
+        preview = limit_image_size(eye_region, max_edge=int(_env_float('VC_PREVIEW_MAX_EDGE', 512)))
+        preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vc-preview')
+        preview_future = preview_executor.submit(self.storage.save_processed_preview, preview)
 
         # Metrics and quality
-        opencv_results = analyze_eye_features(eye_region)
-        quality = compute_image_quality(eye_region) if inp.enable_quality else None
+        opencv_results = analyze_eye_features(eye_region, gray=eye_gray)
+        quality = compute_image_quality(eye_region, gray=eye_gray) if inp.enable_quality else None
 
         # Inference via detector
         onnx_probs: Optional[Dict[str, float]] = None
@@ -208,6 +222,15 @@ class UploadAndAnalyzeImage:
 
         final_confidence = float(max(0.0, min(1.0, calibrated)))
 
+        # A slow storage backend must not hold the response: past the timeout the
+        # record is saved without a preview and the upload finishes on its own
+        try:
+            preview_url = preview_future.result(timeout=_env_float('VC_PREVIEW_UPLOAD_TIMEOUT', 10.0))
+        except Exception:
+            preview_url = None
+        finally:
+            preview_executor.shutdown(wait=False)
+
         duration = time.time() - start_time
 
         # Co-findings summary
@@ -260,6 +283,27 @@ class UploadAndAnalyzeImage:
         }
 
 
+def _decode_rgb(image_file: Any) -> np.ndarray:
+    """Decode an uploaded image into an RGB uint8 array.
+
+    OpenCV decodes straight from the raw bytes into RGB (EXIF orientation ignored,
+    as PIL's Image.open does); PIL remains the fallback for formats OpenCV can't read.
+    The file is rewound afterwards so the repository can store the original.
+    """
+    if hasattr(image_file, 'seek'):
+        image_file.seek(0)
+    raw = image_file.read()
+    if hasattr(image_file, 'seek'):
+        image_file.seek(0)
+    image_array = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR_RGB | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image_array is not None:
+        return image_array
+    pil_image = Image.open(io.BytesIO(raw))
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    return np.array(pil_image)
+
+
 def _generate_conservative_advice(ai_results: Dict[str, Any]) -> str:
     base_advice = "Este es un análisis asistido por IA y no reemplaza un diagnóstico médico profesional. "
     if ai_results['diagnosis'] in ['conjunctivitis', 'cataracts']:
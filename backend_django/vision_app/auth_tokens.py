@@ -0,0 +1,19 @@
+"""JWT issuance helpers shared by the auth endpoints."""
+
+from typing import Dict
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+def issue_tokens(user) -> Dict[str, str]:
+    """Build one refresh token for ``user`` and return the refresh/access pair.
+
+    Both tokens are signed through SimpleJWT's process-wide token backend, which
+    prepares the signing key once; the access token is derived from the same
+    refresh token instead of issuing a second one.
+    """
+    refresh = RefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+    }
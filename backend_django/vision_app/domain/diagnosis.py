@@ -6,7 +6,8 @@ This module must not depend on frameworks or adapters.
 
 from __future__ import annotations
 
-from typing import Dict, Any
+from dataclasses import dataclass
+from typing import Dict, Any, NamedTuple
 import os
 
 
@@ -17,6 +18,88 @@ def _getf(env_name: str, default: float) -> float:
 		return default
 
 
+@dataclass(frozen=True)
+class _Thresholds:
+	redness_minor: float
+	redness_conjunctivitis: float
+	opacity_minor: float
+	opacity_cataract: float
+	vascular_elevated: float
+	vascular_low: float
+	glare_high: float
+	cw_minor: float
+	sclera_red_minor: float
+	sclera_red_strong: float
+	conj_red_minor: float
+	conj_red_strong: float
+	conj_vasc_min: float
+
+
+def _load_thresholds() -> _Thresholds:
+	"""Read tunable thresholds from the environment (once, at import)."""
+	return _Thresholds(
+		redness_minor=_getf('VC_REDNESS_MINOR_TH', 0.50),
+		redness_conjunctivitis=_getf('VC_REDNESS_CONJ_TH', 0.62),
+		opacity_minor=_getf('VC_OPACITY_MINOR_TH', 0.46),
+		opacity_cataract=_getf('VC_OPACITY_CAT_TH', 0.66),
+		vascular_elevated=_getf('VC_VASC_ELEVATED_TH', 0.14),
+		vascular_low=_getf('VC_VASC_LOW_TH', 0.22),
+		glare_high=_getf('VC_GLARE_HIGH_TH', 0.03),
+		cw_minor=_getf('VC_CW_MINOR_TH', 0.24),
+		sclera_red_minor=_getf('VC_SCLERA_RED_MINOR_TH', 0.42),
+		sclera_red_strong=_getf('VC_SCLERA_RED_STRONG_TH', 0.60),
+		conj_red_minor=_getf('VC_CONJ_RED_MINOR_TH', 0.52),
+		conj_red_strong=_getf('VC_CONJ_RED_STRONG_TH', 0.58),
+		conj_vasc_min=_getf('VC_CONJ_VASC_MIN', 0.10),
+	)
+
+
+_TH = _load_thresholds()
+
+# Confidence ramps (lower bound, span) per signal, derived once from the thresholds
+_CONF_R_LO = _TH.redness_minor
+_CONF_R_SPAN = _TH.redness_conjunctivitis - _TH.redness_minor + 1e-6
+_CONF_O_LO = _TH.opacity_minor
+_CONF_O_SPAN = max(0.01, 0.80) - _TH.opacity_minor + 1e-6
+_CONF_W_LO = 0.22
+_CONF_W_SPAN = max(0.23, 0.38) - 0.22 + 1e-6
+
+
+class _CataractMetrics(NamedTuple):
+	o: float
+	vb: float
+	tex: float
+	r: float
+	cw: float
+	h: float
+
+
+# Cataract rules in priority order: (predicate, severity, explanation template).
+# The first matching rule decides; later rules are not evaluated.
+_CATARACT_RULES = (
+	(
+		lambda m: m.o >= 0.88 and m.vb >= 0.70 and m.tex <= 0.015 and m.r <= 0.58 and m.cw >= 0.42,
+		lambda m: 'severe' if (m.o >= 0.92 or m.cw >= 0.50) else 'moderate',
+		"Patrón de iris muy blanqueado: opacidad {m.o:.2f}, brillo {m.vb:.2f}, textura baja {m.tex:.3f}, blancura central {m.cw:.2f}.",
+	),
+	(
+		lambda m: m.o >= 0.82 and m.vb >= 0.62 and m.tex <= 0.020 and m.r < 0.64 and m.cw >= 0.35 and m.h < 0.06,
+		lambda m: 'severe' if (m.o >= 0.88 or m.cw >= 0.42) else 'moderate',
+		"Opacidad alta ({m.o:.2f}), brillo {m.vb:.2f}, textura baja {m.tex:.3f}, blancura central {m.cw:.2f}.",
+	),
+	(
+		lambda m: m.o >= 0.70 and m.vb >= 0.55 and m.h < 0.025 and m.r < 0.62 and m.cw >= 0.30 and m.tex <= 0.08,
+		lambda m: 'severe' if (m.o >= 0.78 or m.cw >= 0.35) else 'moderate',
+		"Opacidad elevada ({m.o:.2f}), brillo {m.vb:.2f}, blancura central {m.cw:.2f} con poca textura {m.tex:.3f}.",
+	),
+	(
+		lambda m: (m.o >= 0.72 or m.cw >= 0.38) and m.vb >= 0.58 and m.r < 0.64 and m.tex <= 0.022,
+		lambda m: 'moderate',
+		"Indicadores compatibles con cataratas: opacidad {m.o:.2f}/blancura {m.cw:.2f}, brillo {m.vb:.2f}, textura baja {m.tex:.3f}.",
+	),
+)
+
+
 def rule_based_diagnosis(opencv_results: Dict[str, Any]) -> Dict[str, Any]:
 	r = float(opencv_results.get('redness_score', 0.0))
 	o = float(opencv_results.get('opacity_score', 0.0))
@@ -33,50 +116,31 @@ def rule_based_diagnosis(opencv_results: Dict[str, Any]) -> Dict[str, Any]:
 	explanation_parts = []
 	co_findings = []
 
-	redness_minor_th = _getf('VC_REDNESS_MINOR_TH', 0.50)
-	redness_conjunctivitis_th = _getf('VC_REDNESS_CONJ_TH', 0.62)
-	opacity_minor_th = _getf('VC_OPACITY_MINOR_TH', 0.46)
-	opacity_cataract_th = _getf('VC_OPACITY_CAT_TH', 0.66)
-	vascular_elevated_th = _getf('VC_VASC_ELEVATED_TH', 0.14)
-	vascular_low_th = _getf('VC_VASC_LOW_TH', 0.22)
-	glare_high_th = _getf('VC_GLARE_HIGH_TH', 0.03)
-	cw_minor_th = _getf('VC_CW_MINOR_TH', 0.24)
-	sclera_red_minor_th = _getf('VC_SCLERA_RED_MINOR_TH', 0.42)
-	sclera_red_strong_th = _getf('VC_SCLERA_RED_STRONG_TH', 0.60)
-	conj_red_minor_th = _getf('VC_CONJ_RED_MINOR_TH', 0.52)
-	conj_red_strong_th = _getf('VC_CONJ_RED_STRONG_TH', 0.58)
-	conj_vasc_min = _getf('VC_CONJ_VASC_MIN', 0.10)
+	th = _TH
+	redness_minor_th = th.redness_minor
+	redness_conjunctivitis_th = th.redness_conjunctivitis
+	opacity_minor_th = th.opacity_minor
+	opacity_cataract_th = th.opacity_cataract
+	vascular_elevated_th = th.vascular_elevated
+	glare_high_th = th.glare_high
+	cw_minor_th = th.cw_minor
+	sclera_red_minor_th = th.sclera_red_minor
+	sclera_red_strong_th = th.sclera_red_strong
+	conj_red_minor_th = th.conj_red_minor
+	conj_red_strong_th = th.conj_red_strong
+	conj_vasc_min = th.conj_vasc_min
 
 	vb = float(opencv_results.get('brightness_mean', 0.0))
 	tex = float(opencv_results.get('texture_index', 0.0))
-	strong_opacity_case = False
 
 	# Cataracts
-	if (o >= 0.88 and vb >= 0.70 and tex <= 0.015 and r <= 0.58 and cw >= 0.42):
-		diagnosis = 'cataracts'
-		strong_opacity_case = True
-		severity = 'severe' if (o >= 0.92 or cw >= 0.50) else 'moderate'
-		explanation_parts.append(
-			f"Patrón de iris muy blanqueado: opacidad {o:.2f}, brillo {vb:.2f}, textura baja {tex:.3f}, blancura central {cw:.2f}."
-		)
-	elif (o >= 0.82 and vb >= 0.62 and tex <= 0.020 and r < 0.64 and cw >= 0.35 and h < 0.06):
-		diagnosis = 'cataracts'
-		severity = 'severe' if (o >= 0.88 or cw >= 0.42) else 'moderate'
-		explanation_parts.append(
-			f"Opacidad alta ({o:.2f}), brillo {vb:.2f}, textura baja {tex:.3f}, blancura central {cw:.2f}."
-		)
-	elif (o >= 0.70 and vb >= 0.55 and h < 0.025 and r < 0.62 and cw >= 0.30 and tex <= 0.08):
-		diagnosis = 'cataracts'
-		severity = 'severe' if (o >= 0.78 or cw >= 0.35) else 'moderate'
-		explanation_parts.append(
-			f"Opacidad elevada ({o:.2f}), brillo {vb:.2f}, blancura central {cw:.2f} con poca textura {tex:.3f}."
-		)
-	elif ((o >= 0.72 or cw >= 0.38) and vb >= 0.58 and r < 0.64 and tex <= 0.022):
-		diagnosis = 'cataracts'
-		severity = 'moderate'
-		explanation_parts.append(
-			f"Indicadores compatibles con cataratas: opacidad {o:.2f}/blancura {cw:.2f}, brillo {vb:.2f}, textura baja {tex:.3f}."
-		)
+	m = _CataractMetrics(o, vb, tex, r, cw, h)
+	for matches, rule_severity, template in _CATARACT_RULES:
+		if matches(m):
+			diagnosis = 'cataracts'
+			severity = rule_severity(m)
+			explanation_parts.append(template.format(m=m))
+			break
 
 	# Redness/Conjunctivitis
 	r_mix = (0.25 * r + 0.50 * r_scl + 0.25 * r_conj)
@@ -113,11 +177,11 @@ def rule_based_diagnosis(opencv_results: Dict[str, Any]) -> Dict[str, Any]:
 
 	# Confidence from rules
 	if (0.25*v + 0.50*v_scl + 0.25*v_conj) >= (vascular_elevated_th * 0.9) or (v_conj >= conj_vasc_min and max(r, r_scl, r_conj) >= redness_minor_th):
-		conf_r = min(max((max(r, r_scl) - redness_minor_th) / (redness_conjunctivitis_th - redness_minor_th + 1e-6), 0), 1)
+		conf_r = min(max((max(r, r_scl) - _CONF_R_LO) / _CONF_R_SPAN, 0), 1)
 	else:
 		conf_r = 0.0
-	conf_o = min(max((o - opacity_minor_th) / (max(0.01, 0.80) - opacity_minor_th + 1e-6), 0), 1)
-	conf_w = min(max((cw - 0.22) / (max(0.23, 0.38) - 0.22 + 1e-6), 0), 1)
+	conf_o = min(max((o - _CONF_O_LO) / _CONF_O_SPAN, 0), 1)
+	conf_w = min(max((cw - _CONF_W_LO) / _CONF_W_SPAN, 0), 1)
 	base_conf = 0.58 * conf_w + 0.35 * conf_o + 0.07 * conf_r
 	if r >= redness_conjunctivitis_th and o >= opacity_cataract_th:
 		base_conf = min(1.0, base_conf + 0.2)
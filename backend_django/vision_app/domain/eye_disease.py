@@ -7,5 +7,7 @@ from .image_processing import (
     analyze_eye_features,
     enhance_image_quality,
     detect_eye_region,
+    detect_eye_region_with_gray,
     compute_image_quality,
+    limit_image_size,
 )
@@ -1,9 +1,26 @@
 from __future__ import annotations
 
 import os
+import threading
 import numpy as np
 import cv2
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+
+
+_EYE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_eye.xml'
+# detectMultiScale keeps per-image state on the classifier, so each thread gets its own
+_cascade_local = threading.local()
+
+
+def _eye_cascade() -> cv2.CascadeClassifier:
+    """Haar eye cascade, parsed once per thread instead of once per request."""
+    cascade = getattr(_cascade_local, 'eye', None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(_EYE_CASCADE_PATH)
+        if cascade.empty():
+            raise RuntimeError(f"Could not load eye cascade from {_EYE_CASCADE_PATH}")
+        _cascade_local.eye = cascade
+    return cascade
 
 
 def _to_uint8(img: np.ndarray) -> np.ndarray:
@@ -90,6 +107,26 @@ def _getb(env_key: str, default: bool) -> bool:
     return val in ("1", "true", "yes", "on")
 
 
+def limit_image_size(image_array: np.ndarray, max_edge: Optional[int] = None) -> np.ndarray:
+    """Downscale so the longest edge is at most ``max_edge`` px (VC_PREP_MAX_EDGE, default 0 = off).
+
+    CLAHE, Canny, Hough and the cascade all scale with pixel count, so capping the
+    frame (INTER_AREA) bounds their cost on large phone photos. The metrics are NOT
+    resolution-invariant: edge densities, Laplacian-based texture/blur and the ROI
+    geometry all shift with scale, so enabling a cap requires re-tuning the
+    thresholds in domain/diagnosis.py. ``max_edge <= 0`` disables the limit.
+    """
+    if max_edge is None:
+        max_edge = _geti('VC_PREP_MAX_EDGE', 0)
+    h, w = image_array.shape[:2]
+    longest = max(h, w)
+    if max_edge <= 0 or longest <= max_edge:
+        return image_array
+    scale = max_edge / float(longest)
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(image_array, size, interpolation=cv2.INTER_AREA)
+
+
 def enhance_image_quality(image_array: np.ndarray) -> np.ndarray:
     """Enhance image quality using configurable OpenCV preprocessing.
 
@@ -146,10 +183,11 @@ def enhance_image_quality(image_array: np.ndarray) -> np.ndarray:
     return img
 
 
-def compute_image_quality(image_array: np.ndarray) -> Dict[str, Any]:
+def compute_image_quality(image_array: np.ndarray, gray: Optional[np.ndarray] = None) -> Dict[str, Any]:
     """Compute simple image quality metrics and a quality score in [0,1]."""
     try:
-        gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+        if gray is None:
+            gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
         hsv = cv2.cvtColor(image_array, cv2.COLOR_RGB2HSV)
         v = hsv[:, :, 2].astype(np.float32)
         lap = cv2.Laplacian(gray, cv2.CV_64F)
@@ -182,16 +220,33 @@ def compute_image_quality(image_array: np.ndarray) -> Dict[str, Any]:
 
 def detect_eye_region(image_array: np.ndarray) -> np.ndarray:
     """Detect eye region in the image using cascade + fallbacks."""
+    return detect_eye_region_with_gray(image_array)[0]
+
+
+def detect_eye_region_with_gray(image_array: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Like :func:`detect_eye_region`, also returning the ROI's grayscale.
+
+    The frame is converted to gray once; every candidate crop and the returned
+    gray ROI are slices of that conversion, so callers can pass it on to
+    :func:`analyze_eye_features` / :func:`compute_image_quality`.
+    """
     gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-    eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
-    eyes = eye_cascade.detectMultiScale(gray, 1.1, 4)
+    # Opt-in: treat small, roughly square uploads as ready-made eye crops and skip
+    # detection. VC_EYE_PRECROPPED_MAX is the short-side limit (default 0 = off);
+    # enabling it changes the ROI, and thus every metric, for such uploads.
+    H, W = gray.shape
+    if min(H, W) < _geti('VC_EYE_PRECROPPED_MAX', 0) and 0.7 < H / float(W) < 1.4:
+        return image_array, gray
+    # Skip the smallest (and most numerous) scan windows: an eye narrower than
+    # VC_EYE_MIN_FRAC of the short side is not a usable ROI anyway
+    min_eye = max(20, int(min(gray.shape) * _getf('VC_EYE_MIN_FRAC', 0.06)))
+    eyes = _eye_cascade().detectMultiScale(gray, 1.1, 4, minSize=(min_eye, min_eye))
     if len(eyes) > 0:
         largest_eye = max(eyes, key=lambda e: e[2] * e[3])
         x, y, w, h = largest_eye
-        return image_array[y:y + h, x:x + w]
+        return image_array[y:y + h, x:x + w], gray[y:y + h, x:x + w]
 
     blur = cv2.medianBlur(gray, 5)
-    H, W = gray.shape
     minR = max(10, int(min(H, W) * 0.06))
     maxR = max(minR + 10, int(min(H, W) * 0.30))
     circles = cv2.HoughCircles(blur, cv2.HOUGH_GRADIENT, dp=1.2, minDist=int(min(H, W) * 0.4),
@@ -202,7 +257,7 @@ def detect_eye_region(image_array: np.ndarray) -> np.ndarray:
         pad = int(r * 1.5)
         x1, x2 = max(0, cx - pad), min(W, cx + pad)
         y1, y2 = max(0, cy - pad), min(H, cy + pad)
-        return image_array[y1:y2, x1:x2]
+        return image_array[y1:y2, x1:x2], gray[y1:y2, x1:x2]
 
     H, W = image_array.shape[:2]
     min_dim = min(W, H)
@@ -219,7 +274,7 @@ def detect_eye_region(image_array: np.ndarray) -> np.ndarray:
         if cw < 64 or ch < 64:
             return (-1.0, (x1, y1, x2, y2))
         crop = image_array[y1:y2, x1:x2]
-        gray_c = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        gray_c = gray[y1:y2, x1:x2]
         lap = cv2.Laplacian(gray_c, cv2.CV_64F)
         lap_var = float(np.var(lap))
         lap_norm = float(lap_var / (lap_var + 300.0))
@@ -259,7 +314,7 @@ def detect_eye_region(image_array: np.ndarray) -> np.ndarray:
         x1, y1, x2, y2 = best_rect
         roi = image_array[y1:y2, x1:x2]
         if roi.shape[0] >= 80 and roi.shape[1] >= 80:
-            return roi
+            return roi, gray[y1:y2, x1:x2]
 
     center_x, center_y = W // 2, H // 2
     crop_size = int(min_dim * 0.80)
@@ -267,17 +322,34 @@ def detect_eye_region(image_array: np.ndarray) -> np.ndarray:
     end_x = min(W, center_x + crop_size // 2)
     start_y = max(0, center_y - crop_size // 2)
     end_y = min(H, center_y + crop_size // 2)
-    return image_array[start_y:end_y, start_x:end_x]
+    return image_array[start_y:end_y, start_x:end_x], gray[start_y:end_y, start_x:end_x]
+
 
+def _masked_nonzero_ratio(img: np.ndarray, mask: np.ndarray) -> float:
+    """Fraction of ``mask`` pixels where ``img`` is non-zero (0.0 for an empty mask)."""
+    mask_u8 = mask.view(np.uint8)
+    total = cv2.countNonZero(mask_u8)
+    if not total:
+        return 0.0
+    return cv2.countNonZero(cv2.bitwise_and(img, img, mask=mask_u8)) / float(total)
 
-def analyze_eye_features(eye_region: np.ndarray) -> Dict[str, Any]:
-    """Compute OpenCV-based metrics and derived indicators."""
-    red_channel = eye_region[:, :, 0].astype(np.float32)
-    green_channel = eye_region[:, :, 1].astype(np.float32)
-    blue_channel = eye_region[:, :, 2].astype(np.float32)
-    redness_score = float(np.mean(red_channel / (green_channel + blue_channel + 1.0)))
 
-    gray = cv2.cvtColor(eye_region, cv2.COLOR_RGB2GRAY)
+def analyze_eye_features(eye_region: np.ndarray, gray: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Compute OpenCV-based metrics and derived indicators.
+
+    ``gray`` may carry the already-computed grayscale of ``eye_region``.
+    """
+    # Per-pixel R/(G+B+1), computed once in two float planes and reused for the
+    # sclera/conjunctiva means below
+    red_ratio = eye_region[:, :, 0].astype(np.float32)
+    denom = eye_region[:, :, 1].astype(np.float32)
+    denom += eye_region[:, :, 2]
+    denom += 1.0
+    np.divide(red_ratio, denom, out=red_ratio)
+    redness_score = float(np.mean(red_ratio))
+
+    if gray is None:
+        gray = cv2.cvtColor(eye_region, cv2.COLOR_RGB2GRAY)
     hsv = cv2.cvtColor(eye_region, cv2.COLOR_RGB2HSV)
     h_ch, s_ch, v_ch = cv2.split(hsv)
 
@@ -346,13 +418,15 @@ def analyze_eye_features(eye_region: np.ndarray) -> Dict[str, Any]:
     if np.count_nonzero(mask_clean_sclera) < 50:
         mask_clean_sclera = mask_sclera_bool
 
-    gray_vals = gray[mask_clean].astype(np.float32)
-    v_vals = v_ch[mask_clean].astype(np.float32)
-    s_vals = s_ch[mask_clean].astype(np.float32)
-
-    std_gray = (np.std(gray_vals) / 255.0) if gray_vals.size else 0.0
-    mean_v = (np.mean(v_vals) / 255.0) if v_vals.size else 0.0
-    mean_s = (np.mean(s_vals) / 255.0) if s_vals.size else 0.0
+    # Masked statistics in single OpenCV passes (bool masks viewed as 0/1 uint8, no copies)
+    clean_u8 = mask_clean.view(np.uint8)
+    if cv2.countNonZero(clean_u8):
+        _, std = cv2.meanStdDev(gray, mask=clean_u8)
+        std_gray = float(std[0, 0]) / 255.0
+        mean_v = cv2.mean(v_ch, mask=clean_u8)[0] / 255.0
+        mean_s = cv2.mean(s_ch, mask=clean_u8)[0] / 255.0
+    else:
+        std_gray = mean_v = mean_s = 0.0
 
     bright_thresh = 200
     sat_low_thresh = 80
@@ -362,12 +436,15 @@ def analyze_eye_features(eye_region: np.ndarray) -> Dict[str, Any]:
     central_whiteness = float(np.count_nonzero(whiteness_mask)) / float(np.count_nonzero(mask_bool) or 1)
 
     edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
-    edges_in_mask = float(np.count_nonzero(edges[mask_bool] > 0)) / float(np.count_nonzero(mask_bool) or 1)
-    edges_in_sclera = float(np.count_nonzero(edges[mask_clean_sclera] > 0)) / float(np.count_nonzero(mask_clean_sclera) or 1)
-    edges_in_conj = float(np.count_nonzero(edges[mask_clean_conj] > 0)) / float(np.count_nonzero(mask_clean_conj) or 1)
+    edges_in_mask = _masked_nonzero_ratio(edges, mask_bool)
+    edges_in_sclera = _masked_nonzero_ratio(edges, mask_clean_sclera)
+    edges_in_conj = _masked_nonzero_ratio(edges, mask_clean_conj)
     lap = cv2.Laplacian(gray, cv2.CV_64F)
-    lap_vals = lap[mask_clean]
-    lap_var = float(np.var(lap_vals)) if lap_vals.size else 0.0
+    if cv2.countNonZero(clean_u8):
+        _, lap_std = cv2.meanStdDev(lap, mask=clean_u8)
+        lap_var = float(lap_std[0, 0]) ** 2
+    else:
+        lap_var = 0.0
     lap_norm = min(1.0, lap_var / 200.0)
     blur_score = 1.0 - lap_norm
 
@@ -387,10 +464,10 @@ def analyze_eye_features(eye_region: np.ndarray) -> Dict[str, Any]:
     glare_penalty = 0.15 * glare_penalty_factor
     opacity_score = float(max(0.0, min(1.0, opacity_raw - glare_penalty)))
     vascular_density = float(edges_in_mask)
-    sclera_red_vals = (red_channel[mask_clean_sclera] / (green_channel[mask_clean_sclera] + blue_channel[mask_clean_sclera] + 1.0)) if np.count_nonzero(mask_clean_sclera) > 0 else np.array([0.0], dtype=np.float32)
+    sclera_red_vals = red_ratio[mask_clean_sclera] if np.count_nonzero(mask_clean_sclera) > 0 else np.array([0.0], dtype=np.float32)
     sclera_redness = float(np.mean(sclera_red_vals)) if sclera_red_vals.size else 0.0
     sclera_vascular_density = float(edges_in_sclera)
-    conj_red_vals = (red_channel[mask_clean_conj] / (green_channel[mask_clean_conj] + blue_channel[mask_clean_conj] + 1.0)) if np.count_nonzero(mask_clean_conj) > 0 else np.array([0.0], dtype=np.float32)
+    conj_red_vals = red_ratio[mask_clean_conj] if np.count_nonzero(mask_clean_conj) > 0 else np.array([0.0], dtype=np.float32)
     conj_redness = float(np.mean(conj_red_vals)) if conj_red_vals.size else 0.0
     conj_vascular_density = float(edges_in_conj)
 
@@ -1,31 +1,155 @@
+from decimal import Decimal
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from .models import User, Analysis, AnalysisSession
-import re
 from django.core.files.storage import default_storage
 from django.conf import settings
 
+# Storage backend is fixed at startup; resolve it once instead of per serialization
+_STORAGE_KIND = str(getattr(settings, 'VC_STORAGE', 'media')).strip().lower()
+_IS_REMOTE_STORAGE = _STORAGE_KIND in ('supabase', 'supabase_storage')
+# URLs already absolute (e.g. Supabase public/signed URLs) must not be wrapped again
+_ABS_PREFIXES = ('http://', 'https://')
+# Accepted analysis uploads: common MIME variants plus an extension fallback
+_ALLOWED_MIME = frozenset({
+    'image/jpeg', 'image/jpg', 'image/pjpeg', 'image/jfif',
+    'image/png', 'image/x-png',
+    'image/webp',
+})
+_ALLOWED_EXT = frozenset({'jpg', 'jpeg', 'png', 'webp'})
+_MAX_IMAGE_BYTES = 10 * 1024 * 1024  # 10MB
+
+
+# Dígito multiplicado por 2 (coeficiente de las posiciones pares), restando 9 si es >= 10
+_DOUBLED = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
+
 
 def validar_cedula_ecuador(cedula: str) -> bool:
     """Valida cédula ecuatoriana de 10 dígitos con dígito verificador."""
-    if not cedula or not cedula.isdigit() or len(cedula) != 10:
+    if not cedula or len(cedula) != 10 or not cedula.isascii() or not cedula.isdigit():
         return False
-    provincia = int(cedula[0:2])
+    d = [c - 48 for c in cedula.encode('ascii')]
+    provincia = d[0] * 10 + d[1]
     if not (0 <= provincia <= 24 or provincia == 30):
         return False
     # tercer dígito < 6 para personas naturales
-    if int(cedula[2]) >= 6:
+    if d[2] >= 6:
         return False
-    coef = [2, 1, 2, 1, 2, 1, 2, 1, 2]
-    total = 0
-    for i in range(9):
-        prod = int(cedula[i]) * coef[i]
-        if prod >= 10:
-            prod -= 9
-        total += prod
+    # Coeficientes 2,1,2,1,2,1,2,1,2
+    total = (
+        _DOUBLED[d[0]] + _DOUBLED[d[2]] + _DOUBLED[d[4]] + _DOUBLED[d[6]] + _DOUBLED[d[8]]
+        + d[1] + d[3] + d[5] + d[7]
+    )
     verificador = (10 - (total % 10)) % 10
-    return verificador == int(cedula[9])
+    return verificador == d[9]
+
+def _telefono_valido(phone: str) -> bool:
+    """E.164 (+ y 8-15 dígitos) o formato local de Ecuador 09XXXXXXXX."""
+    n = len(phone)
+    if phone.startswith('+'):
+        return 9 <= n <= 16 and phone[1:].isdecimal()
+    return n == 10 and phone.startswith('09') and phone[2:].isdecimal()
+
+
+# Campos de texto que se normalizan (strip) durante el registro
+_REGISTRATION_STRIP_FIELDS = ('first_name', 'last_name', 'email', 'username', 'cedula', 'phone', 'address')
+
+
+def _avatar_url(user, request, check_exists: bool = True):
+    """Absolute, cache-busted avatar URL for ``user`` (None when there is no avatar).
+
+    ``check_exists`` probes local media storage to avoid broken links; nested
+    representations skip it since it costs a filesystem/storage call per row.
+    """
+    if not getattr(user, 'avatar', None):
+        return None
+
+    # In Supabase mode, avoid exists() check which can be slow or unreliable
+    if check_exists and not _IS_REMOTE_STORAGE:
+        # Local media mode: avoid returning broken links
+        try:
+            name = getattr(user.avatar, 'name', None)
+            if not name or not default_storage.exists(name):
+                return None
+        except Exception:
+            return None
+
+    url = getattr(user.avatar, 'url', None)
+    if not url:
+        return None
+    # If storage returns an absolute URL (e.g., Supabase), don't wrap it again
+    if url.startswith(_ABS_PREFIXES):
+        base = url
+    else:
+        base = request.build_absolute_uri(url) if request else url
+    # Cache-busting using last update timestamp (skip if URL already has query like signed URLs)
+    version = _avatar_version(user)
+    if version is not None and '?' not in base:
+        return f"{base}?v={version}"
+    return base
+
+
+def _avatar_version(user):
+    """Cache-busting version derived from ``updated_at``, memoized on the instance.
+
+    The cached value is keyed by ``updated_at`` so a save() in between yields a fresh version.
+    """
+    updated_at = getattr(user, 'updated_at', None)
+    if not updated_at:
+        return None
+    cached = getattr(user, '_avatar_version', None)
+    if cached is not None and cached[0] == updated_at:
+        return cached[1]
+    try:
+        version = int(updated_at.timestamp())
+    except Exception:
+        return None
+    user._avatar_version = (updated_at, version)
+    return version
+
+
+def _user_summary(user, request):
+    """Lightweight user representation for nesting inside analysis payloads."""
+    return {
+        'id': str(user.pk),
+        'username': user.username,
+        'avatar_url': _avatar_url(user, request, check_exists=False),
+    }
+
+
+def _absolute_uri_builder(context):
+    """Return a per-request callable that makes relative URLs absolute (None without request).
+
+    Root-relative paths such as ``/media/...`` are joined to the scheme+host computed
+    once; anything else falls back to ``request.build_absolute_uri``. The callable is
+    cached in the serializer context so every row of a response shares it.
+    """
+    builder = context.get('_abs_uri')
+    if builder is not None:
+        return builder
+    request = context.get('request')
+    if request is None:
+        return None
+    origin = request.build_absolute_uri('/')[:-1]
+    build_absolute_uri = request.build_absolute_uri
+
+    def builder(url):
+        if url[:1] == '/' and url[1:2] != '/' and url.isascii():
+            return origin + url
+        return build_absolute_uri(url)
+
+    context['_abs_uri'] = builder
+    return builder
+
+
+def _char_field_value(value):
+    """What a default CharField would produce for ``value`` (str, trimmed), or None if it would reject it."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float, Decimal)):
+        return None
+    return str(value).strip()
+
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """Serializer para registro de usuario con campos adicionales"""
@@ -49,23 +173,28 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             'age', 'cedula', 'gender', 'phone', 'address', 'country', 'state', 'city'
         )
     
+    def to_internal_value(self, data):
+        # Rechazo barato antes de validar campos: evita correr validate_password
+        # (CommonPasswordValidator carga y consulta su lista) cuando no coinciden
+        if hasattr(data, 'get'):
+            password = _char_field_value(data.get('password'))
+            password_confirm = _char_field_value(data.get('password_confirm'))
+            if password is not None and password_confirm is not None and password != password_confirm:
+                raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ["Passwords don't match"]})
+        return super().to_internal_value(data)
+
     def validate(self, attrs):
-        if attrs['password'] != attrs['password_confirm']:
-            raise serializers.ValidationError("Passwords don't match")
         # Normalización
-        attrs['first_name'] = (attrs.get('first_name') or '').strip()
-        attrs['last_name'] = (attrs.get('last_name') or '').strip()
-        attrs['email'] = (attrs.get('email') or '').strip().lower()
-        attrs['username'] = (attrs.get('username') or '').strip()
-        attrs['cedula'] = (attrs.get('cedula') or '').strip()
-        attrs['phone'] = (attrs.get('phone') or '').strip()
-        attrs['address'] = (attrs.get('address') or '').strip()
+        for field in _REGISTRATION_STRIP_FIELDS:
+            value = attrs.get(field)
+            attrs[field] = value.strip() if value else ''
+        attrs['email'] = attrs['email'].lower()
         # Validaciones específicas
         if not validar_cedula_ecuador(attrs['cedula']):
             raise serializers.ValidationError({'cedula': 'La cédula ecuatoriana no es válida'})
         # Teléfono Ecuador: 09XXXXXXXX (local) o +5939XXXXXXXX (internacional)
         # Ampliar validación: aceptar E.164 que empiece por + y 8-15 dígitos (o formato local de Ecuador)
-        if not re.fullmatch(r"(?:\+\d{8,15}|09\d{8}|\+5939\d{8})", attrs['phone']):
+        if not _telefono_valido(attrs['phone']):
             raise serializers.ValidationError({'phone': 'Formato de teléfono inválido. Use +[código][número] o 09XXXXXXXX en Ecuador'})
         # Unicidad amigable antes de intentar insertar (evita 500 por IntegrityError)
         if attrs['email'] and User.objects.filter(email__iexact=attrs['email']).exists():
@@ -116,37 +245,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
     def get_avatar_url(self, obj):
-        if not getattr(obj, 'avatar', None):
-            return None
-        request = self.context.get('request')
-
-        # In Supabase mode, avoid exists() check which can be slow or unreliable
-        storage_kind = str(getattr(settings, 'VC_STORAGE', 'media')).strip().lower()
-        if storage_kind not in ('supabase', 'supabase_storage'):
-            # Local media mode: avoid returning broken links
-            try:
-                name = getattr(obj.avatar, 'name', None)
-                if not name or not default_storage.exists(name):
-                    return None
-            except Exception:
-                return None
-
-        url = getattr(obj.avatar, 'url', None)
-        if not url:
-            return None
-        # If storage returns an absolute URL (e.g., Supabase), don't wrap it again
-        if str(url).startswith(('http://', 'https://')):
-            base = url
-        else:
-            base = request.build_absolute_uri(url) if request else url
-        # Cache-busting using last update timestamp (skip if URL already has query like signed URLs)
-        try:
-            version = int(obj.updated_at.timestamp()) if getattr(obj, 'updated_at', None) else None
-        except Exception:
-            version = None
-        if version is not None and '?' not in base:
-            return f"{base}?v={version}"
-        return base
+        return _avatar_url(obj, self.context.get('request'))
 
     def validate_email(self, value):
         value = (value or '').strip().lower()
@@ -171,9 +270,43 @@ class UserProfileSerializer(serializers.ModelSerializer):
             validated_data['username'] = validated_data['username'].strip()
         return super().update(instance, validated_data)
 
+# Stateless field instances reused to format values exactly as UserProfileSerializer does
+_DATETIME_FIELD = serializers.DateTimeField()
+_WEIGHT_FIELD = serializers.DecimalField(max_digits=5, decimal_places=2)
+_HEIGHT_FIELD = serializers.DecimalField(max_digits=3, decimal_places=2)
+
+
+def serialize_user_profile(user, request) -> dict:
+    """Read-only fast path producing the same payload as ``UserProfileSerializer(user).data``.
+
+    Use UserProfileSerializer for writes/validation; responses that only render a
+    profile can use this to skip DRF's per-field dispatch.
+    """
+    return {
+        'id': str(user.pk),
+        'email': user.email,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'age': user.age,
+        'cedula': user.cedula,
+        'gender': user.gender,
+        'phone': user.phone,
+        'address': user.address,
+        'country': user.country,
+        'state': user.state,
+        'city': user.city,
+        'blood_type': user.blood_type,
+        'weight_kg': _WEIGHT_FIELD.to_representation(user.weight_kg) if user.weight_kg is not None else None,
+        'height_m': _HEIGHT_FIELD.to_representation(user.height_m) if user.height_m is not None else None,
+        'avatar_url': _avatar_url(user, request),
+        'created_at': _DATETIME_FIELD.to_representation(user.created_at) if user.created_at else None,
+    }
+
+
 class AnalysisSerializer(serializers.ModelSerializer):
     """Serializer for eye analysis results"""
-    user = UserProfileSerializer(read_only=True)
+    user = serializers.SerializerMethodField()
     image_url = serializers.SerializerMethodField()
     requires_medical_attention = serializers.BooleanField(read_only=True)
     is_normal = serializers.BooleanField(read_only=True)
@@ -196,13 +329,16 @@ class AnalysisSerializer(serializers.ModelSerializer):
             'image_width', 'image_height', 'requires_medical_attention', 'is_normal'
         ]
     
+    def get_user(self, obj):
+        return _user_summary(obj.user, self.context.get('request'))
+
     def get_image_url(self, obj):
         if obj.image:
             url = obj.image.url
             if not url:
                 return None
             # Avoid double-wrapping absolute Supabase URLs
-            if str(url).startswith(('http://', 'https://')):
+            if url.startswith(_ABS_PREFIXES):
                 return url
             request = self.context.get('request')
             return request.build_absolute_uri(url) if request else url
@@ -215,23 +351,19 @@ class AnalysisCreateSerializer(serializers.ModelSerializer):
         fields = ['image']
     
     def validate_image(self, value):
-        # Validate file size (10MB max)
-        if value.size > 10 * 1024 * 1024:
+        # Validate file size (10MB max) using the size recorded by the upload handler
+        size = getattr(value, 'size', None)
+        if size and size > _MAX_IMAGE_BYTES:
             raise serializers.ValidationError("Image file size cannot exceed 10MB")
         
         # Validate file type: allow common MIME variants and fallback to extension if needed
-        allowed_types = {
-            'image/jpeg', 'image/jpg', 'image/pjpeg', 'image/jfif',
-            'image/png', 'image/x-png',
-            'image/webp',
-        }
         ctype = getattr(value, 'content_type', None)
-        ok_type = bool(ctype and ctype.lower() in allowed_types)
+        ok_type = bool(ctype and ctype.lower() in _ALLOWED_MIME)
         if not ok_type:
             # Fallback a la extensión del archivo cuando el navegador no envía un Content-Type estándar
             name = getattr(value, 'name', '')
             ext = (name.rsplit('.', 1)[-1] or '').lower()
-            if ext in {'jpg', 'jpeg', 'png', 'webp'}:
+            if ext in _ALLOWED_EXT:
                 ok_type = True
         if not ok_type:
             raise serializers.ValidationError("Only JPEG, PNG, and WEBP images are allowed")
@@ -249,6 +381,13 @@ class AnalysisHistorySerializer(serializers.ModelSerializer):
             'created_at', 'requires_medical_attention', 'is_normal'
         ]
     
+    def to_representation(self, instance):
+        # With many=True the same child serializer renders every row; bind the
+        # request-dependent URL builder once instead of resolving it per row.
+        if not hasattr(self, '_abs_uri'):
+            self._abs_uri = _absolute_uri_builder(self.context)
+        return super().to_representation(instance)
+
     def get_image_url(self, obj):
         """Return a lightweight preview URL when available; fallback to original image.
 
@@ -256,43 +395,42 @@ class AnalysisHistorySerializer(serializers.ModelSerializer):
         - If it's a relative path, make it absolute using request.
         - Otherwise, use the original ImageField URL.
         """
-        # 1) Prefer processed preview saved during analysis
-        try:
-            raw = obj.ai_raw_response or {}
-            preview = raw.get('processed_image_url')
-            if preview:
-                if isinstance(preview, str) and preview.startswith(('http://', 'https://')):
-                    return preview
-                request = self.context.get('request')
-                if request and isinstance(preview, str):
-                    return request.build_absolute_uri(preview)
-                return preview
-        except Exception:
-            pass
-
-        # 2) Fallback to original uploaded image
-        if getattr(obj, 'image', None):
-            try:
-                url = obj.image.url
-            except Exception:
-                url = None
+        abs_uri = self._abs_uri
+        # 1) Prefer processed preview saved during analysis (annotated as preview_url by
+        #    the history queryset so ai_raw_response is not loaded per row)
+        if hasattr(obj, 'preview_url'):
+            preview = obj.preview_url
+        else:
+            raw = obj.ai_raw_response
+            preview = raw.get('processed_image_url') if isinstance(raw, dict) else None
+        if preview:
+            if isinstance(preview, str) and abs_uri and not preview.startswith(_ABS_PREFIXES):
+                return abs_uri(preview)
+            return preview
+
+        # 2) Fallback to original uploaded image (FieldFile.url raises only when no file name is set)
+        image = obj.image
+        if image and image.name:
+            url = image.url
             if not url:
                 return None
-            if str(url).startswith(('http://', 'https://')):
+            if url.startswith(_ABS_PREFIXES):
                 return url
-            request = self.context.get('request')
-            return request.build_absolute_uri(url) if request else url
+            return abs_uri(url) if abs_uri else url
         return None
 
 class AnalysisSessionSerializer(serializers.ModelSerializer):
     """Serializer for analysis sessions"""
-    user = UserProfileSerializer(read_only=True)
+    user = serializers.SerializerMethodField()
     
     class Meta:
         model = AnalysisSession
         fields = ['id', 'user', 'session_start', 'session_end', 'analyses_count']
         read_only_fields = ['id', 'user', 'session_start', 'session_end', 'analyses_count']
 
+    def get_user(self, obj):
+        return _user_summary(obj.user, self.context.get('request'))
+
 
 class PasswordChangeSerializer(serializers.Serializer):
     """Serializer to change user password"""
@@ -1,3 +1,155 @@
-from django.test import TestCase
+import re
+import shutil
+import tempfile
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIRequestFactory
+
+from .models import User
+from .serializers import (
+    UserProfileSerializer,
+    UserRegistrationSerializer,
+    _telefono_valido,
+    serialize_user_profile,
+    validar_cedula_ecuador,
+)
+
+# Phone rule as it was written before _telefono_valido replaced it
+_OLD_PHONE_RE = r"(?:\+\d{8,15}|09\d{8}|\+5939\d{8})"
+
+
+def _old_validar_cedula_ecuador(cedula):
+    """Reference implementation the optimized validator must agree with on ASCII input."""
+    if not cedula or not cedula.isdigit() or len(cedula) != 10:
+        return False
+    provincia = int(cedula[0:2])
+    if provincia < 0 or (provincia > 24 and provincia != 30):
+        return False
+    if int(cedula[2]) >= 6:
+        return False
+    coef = [2, 1, 2, 1, 2, 1, 2, 1, 2]
+    total = 0
+    for i in range(9):
+        prod = int(cedula[i]) * coef[i]
+        total += prod - 9 if prod >= 10 else prod
+    verificador = (10 - (total % 10)) % 10
+    return verificador == int(cedula[9])
+
+
+def _with_check_digit(first9):
+    for last in '0123456789':
+        if _old_validar_cedula_ecuador(first9 + last):
+            return first9 + last
+    raise AssertionError(first9)
+
+
+class CedulaValidationTests(SimpleTestCase):
+    def test_valid_cedulas(self):
+        for first9 in ('171003406', '010203040', '240000001', '300000000', '095123456'):
+            with self.subTest(first9=first9):
+                self.assertTrue(validar_cedula_ecuador(_with_check_digit(first9)))
+
+    def test_invalid_cedulas(self):
+        valid = _with_check_digit('171003406')
+        wrong_digit = valid[:9] + str((int(valid[9]) + 1) % 10)
+        for cedula in ('', valid[:9], valid + '0', wrong_digit, '2500000000', '1770000000',
+                       '17100340a5', ' ' + valid[1:], None):
+            with self.subTest(cedula=cedula):
+                self.assertFalse(validar_cedula_ecuador(cedula))
+
+    def test_matches_reference_on_ascii_digits(self):
+        samples = [f'{n:010d}' for n in range(0, 10 ** 10, 7919 * 13 + 1)]
+        samples += [_with_check_digit(f'{p:02d}{t}000000') for p in (0, 1, 12, 24, 30) for t in range(6)]
+        for cedula in samples:
+            with self.subTest(cedula=cedula):
+                self.assertEqual(validar_cedula_ecuador(cedula), _old_validar_cedula_ecuador(cedula))
+
+    def test_rejects_non_ascii_digits(self):
+        valid = _with_check_digit('171003406')
+        arabic_indic = valid.translate(str.maketrans('0123456789', '٠١٢٣٤٥٦٧٨٩'))
+        fullwidth = valid.translate(str.maketrans('0123456789', '０１２３４５６７８９'))
+        superscript = valid[:9] + '²'
+        for cedula in (arabic_indic, fullwidth, superscript):
+            with self.subTest(cedula=cedula):
+                self.assertTrue(cedula.isdigit())
+                self.assertFalse(validar_cedula_ecuador(cedula))
+
+
+class PhoneValidationTests(SimpleTestCase):
+    SAMPLES = (
+        '', '+', '09', '0991234567', '099123456', '09912345678', '0891234567', '9991234567',
+        '+5939912345', '+593991234567', '+59399123456', '+1234567', '+12345678',
+        '+123456789012345', '+1234567890123456', '++12345678', '+12 345678', '+1234-5678',
+        '0991234567 ', ' 0991234567', '09912345a7', '+١٢٣٤٥٦٧٨٩', '٠٩١٢٣٤٥٦٧٨',
+        '０９１２３４５６７８', '0991234567\n', '+12345678\n', '09²1234567',
+    )
+
+    def test_matches_previous_regex(self):
+        for phone in self.SAMPLES:
+            with self.subTest(phone=phone):
+                self.assertEqual(_telefono_valido(phone), bool(re.fullmatch(_OLD_PHONE_RE, phone)))
+
+
+class RegistrationPasswordMismatchTests(SimpleTestCase):
+    def _errors(self, **data):
+        serializer = UserRegistrationSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        return serializer.errors
+
+    def test_mismatch_rejected_before_field_validation(self):
+        errors = self._errors(password='123', password_confirm='456', email='not-an-email')
+        self.assertEqual(errors, {'non_field_errors': ["Passwords don't match"]})
+
+    def test_values_equal_after_charfield_coercion_are_not_a_mismatch(self):
+        for password, confirm in (('Secreto123!', 'Secreto123! '), (' Secreto123!', 'Secreto123!'),
+                                  (12345678, '12345678'), (1.5, '1.5')):
+            with self.subTest(password=password, confirm=confirm):
+                errors = self._errors(password=password, password_confirm=confirm)
+                self.assertNotIn("Passwords don't match", errors.get('non_field_errors', []))
+
+    def test_non_string_values_left_to_field_validation(self):
+        errors = self._errors(password=['a'], password_confirm='a')
+        self.assertIn('password', errors)
+        self.assertNotIn('non_field_errors', errors)
+
+
+class SerializeUserProfileTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.request = APIRequestFactory().get('/api/auth/profile/')
+
+    def _create_user(self, **extra):
+        return User.objects.create_user(
+            email='ana@example.com', username='ana', password='Secreto123!',
+            first_name='Ana', last_name='Pérez', **extra
+        )
+
+    def assert_matches_serializer(self, user):
+        user = User.objects.get(pk=user.pk)
+        expected = UserProfileSerializer(user, context={'request': self.request}).data
+        payload = serialize_user_profile(user, self.request)
+        self.assertEqual(payload, dict(expected))
+        return payload
+
+    def test_minimal_profile(self):
+        self.assert_matches_serializer(self._create_user())
+
+    def test_full_profile(self):
+        user = self._create_user(
+            age=34, cedula=_with_check_digit('171003406'), gender='female', phone='0991234567',
+            address='Av. Amazonas', country='Ecuador', state='Pichincha', city='Quito',
+            blood_type='O+', weight_kg=Decimal('61.5'), height_m=Decimal('1.6'),
+        )
+        self.assert_matches_serializer(user)
+
+    def test_profile_with_avatar(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            user = self._create_user()
+            user.avatar = SimpleUploadedFile('a.png', b'\x89PNG\r\n\x1a\n', content_type='image/png')
+            user.save()
+            self.assertIsNotNone(self.assert_matches_serializer(user)['avatar_url'])
+            user.avatar.storage.delete(user.avatar.name)
+            self.assertIsNone(self.assert_matches_serializer(user)['avatar_url'])
@@ -1,29 +1,34 @@
+import hashlib
 import os
+import re
 from datetime import datetime
-from io import BytesIO
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+from wsgiref.util import FileWrapper
 from django.conf import settings
-from django.http import HttpResponse
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.text import compress_sequence
 from django.shortcuts import get_object_or_404
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework_simplejwt.tokens import RefreshToken
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from rest_framework.pagination import PageNumberPagination
 
 from .models import User, Analysis
 from django.db import IntegrityError
+from django.db.models.fields.json import KeyTextTransform
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer,
     AnalysisSerializer, AnalysisCreateSerializer, AnalysisHistorySerializer,
-    PasswordChangeSerializer,
+    PasswordChangeSerializer, serialize_user_profile,
 )
 from .infer import get_runtime_debug
+from .auth_tokens import issue_tokens
+from .adapters.storage.supabase_common import get_previews_supabase
 
 # Hexagonal adapters and use case
 from .application.use_cases.upload_and_analyze_image import UploadAndAnalyzeInput
@@ -31,6 +36,31 @@ from .config.container import get_analysis_use_case
 
 # OpenAI removed
 
+# Unique-constraint column named in an IntegrityError -> user-facing message
+_UNIQUE_RE = re.compile(r'email|username|cedula', re.I)
+_UNIQUE_MSG = {
+    'email': {'email': 'Este correo ya está registrado'},
+    'username': {'username': 'Este usuario ya está registrado'},
+    'cedula': {'cedula': 'Esta cédula ya está registrada'},
+}
+_UNIQUE_FALLBACK = {'non_field_errors': 'No se pudo registrar'}
+
+def _serialize_user(user, request):
+    """Profile payload for ``user``, memoized on the request.
+
+    Keyed by primary key and ``updated_at`` so a save() within the same request
+    produces a fresh payload.
+    """
+    cache = getattr(request, '_vc_user_ser_cache', None)
+    if cache is None:
+        cache = {}
+        request._vc_user_ser_cache = cache
+    key = (user.pk, getattr(user, 'updated_at', None))
+    data = cache.get(key)
+    if data is None:
+        data = cache[key] = serialize_user_profile(user, request)
+    return data
+
 class RegisterView(generics.CreateAPIView):
     """User registration endpoint"""
     queryset = User.objects.all()
@@ -44,26 +74,15 @@ class RegisterView(generics.CreateAPIView):
             user = serializer.save()
         except IntegrityError as e:
             # Map common unique constraints to friendly messages
-            msg = str(e)
-            detail = {'non_field_errors': 'No se pudo registrar'}
-            lowered = msg.lower()
-            if 'email' in lowered:
-                detail = {'email': 'Este correo ya está registrado'}
-            elif 'username' in lowered:
-                detail = {'username': 'Este usuario ya está registrado'}
-            elif 'cedula' in lowered:
-                detail = {'cedula': 'Esta cédula ya está registrada'}
+            m = _UNIQUE_RE.search(str(e))
+            detail = _UNIQUE_MSG.get(m.group(0).lower() if m else None, _UNIQUE_FALLBACK)
             return Response(detail, status=status.HTTP_400_BAD_REQUEST)
 
         # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
         return Response({
             'message': 'Usuario registrado correctamente',
-            'user': UserProfileSerializer(user, context={"request": request}).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            }
+            'user': _serialize_user(user, request),
+            'tokens': issue_tokens(user),
         }, status=status.HTTP_201_CREATED)
 
 class LoginView(APIView):
@@ -74,14 +93,10 @@ class LoginView(APIView):
         serializer = UserLoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
         return Response({
             'message': 'Inicio de sesión exitoso',
-            'user': UserProfileSerializer(user, context={"request": request}).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            }
+            'user': _serialize_user(user, request),
+            'tokens': issue_tokens(user),
         })
 
 class ProfileView(APIView):
@@ -89,8 +104,7 @@ class ProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        serializer = UserProfileSerializer(request.user, context={"request": request})
-        return Response(serializer.data)
+        return Response(_serialize_user(request.user, request))
 
     def put(self, request):
         serializer = UserProfileSerializer(instance=request.user, data=request.data, context={"request": request})
@@ -117,9 +131,31 @@ class ChangePasswordView(APIView):
         user.save()
         return Response({"message": "Contraseña actualizada correctamente"}, status=status.HTTP_200_OK)
 
+# Leading bytes of the image formats accepted as avatars
+_MAGIC = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def _sniff_image_type(file):
+    """Detect the image MIME type from the first bytes of an upload (None if unsupported)."""
+    try:
+        head = file.read(16)
+        file.seek(0)
+    except Exception:
+        return None
+    for prefix, mime in _MAGIC:
+        if head.startswith(prefix):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
 class UploadAvatarView(APIView):
     """Upload or replace the authenticated user's avatar image."""
-    parser_classes = [MultiPartParser, FormParser]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -129,169 +165,42 @@ class UploadAvatarView(APIView):
         # Basic validations
         if file.size > 5 * 1024 * 1024:  # 5MB
             return Response({"error": "La imagen no puede exceder 5MB"}, status=status.HTTP_400_BAD_REQUEST)
-        # Allow common image types for avatars
-        allowed = {'image/jpeg', 'image/jpg', 'image/png', 'image/webp', 'image/gif'}
-        if getattr(file, 'content_type', None) not in allowed:
+        # Allow common image types for avatars (detected from file content, not the client header)
+        if _sniff_image_type(file) is None:
             return Response({"error": "Solo se permiten imágenes JPEG/PNG/WEBP/GIF"}, status=status.HTTP_400_BAD_REQUEST)
 
         user = request.user
         user.avatar = file
         user.save()
-        data = UserProfileSerializer(user, context={"request": request}).data
+        data = _serialize_user(user, request)
         # Also include avatar_url at the top-level for convenient frontend consumption
         return Response({"message": "Avatar actualizado", "avatar_url": data.get("avatar_url"), "user": data}, status=status.HTTP_200_OK)
 
-def rule_based_diagnosis(opencv_results):
-    """Derive diagnosis, severity, confidence, explanation and recommendations based on OpenCV metrics."""
-    r = opencv_results.get('redness_score', 0.0)
-    o = opencv_results.get('opacity_score', 0.0)
-    v = opencv_results.get('vascular_density', 0.0)
-    h = opencv_results.get('highlight_ratio', 0.0)
-    cw = opencv_results.get('central_whiteness', 0.0)
-
-    diagnosis = 'normal'
-    severity = 'normal'
-    explanation_parts = []
-    co_findings = []  # secondary concurrent hints
-
-    # Simple thresholds (tunable)
-    # Thresholds can be tuned via environment variables to control sensitivity
-    try:
-        # Requested: rojez moderada a partir de 0.50
-        redness_minor_th = float(os.getenv('VC_REDNESS_MINOR_TH', '0.50'))
-    except Exception:
-        redness_minor_th = 0.50
-    try:
-        redness_conjunctivitis_th = float(os.getenv('VC_REDNESS_CONJ_TH', '0.66'))  # was 0.62
-    except Exception:
-        redness_conjunctivitis_th = 0.66
-    # Requested: opacidades menores a partir de 0.40
-    opacity_minor_th = 0.40
-    opacity_cataract_th = 0.62
+def _setting_or_env(name, default):
+    return getattr(settings, name, os.getenv(name, default))
+
+
+def _bool_setting(name, default):
+    return str(_setting_or_env(name, default)).strip() not in ('0', 'false', 'False', '')
+
+
+def _float_setting(name, default):
+    # Resolved at import: a malformed value must not keep the URLconf from loading
     try:
-        vascular_elevated_th = float(os.getenv('VC_VASC_ELEVATED_TH', '0.10'))  # was 0.08
-    except Exception:
-        vascular_elevated_th = 0.10
-    vascular_low_th = 0.22
-    glare_high_th = 0.025
-    strong_opacity_th = 0.80
-    whiteness_cataract_th = 0.35
-
-    # Redness-driven conditions
-    if r >= redness_conjunctivitis_th and v >= vascular_elevated_th:
-        diagnosis = 'conjunctivitis'
-        # Requested: corte de severidad a 0.60 (nota: dado r>=0.66, usualmente será 'severe')
-        severity = 'moderate' if r < 0.60 else 'severe'
-        explanation_parts.append(f"Elevada rojez ({r:.2f}) y densidad vascular ({v:.2f}) sugieren conjuntivitis.")
-    elif r >= redness_minor_th:
-        diagnosis = 'redness_minor'
-        severity = 'mild'
-        explanation_parts.append(f"Rojez moderada ({r:.2f}) sin incremento marcado de vascularización.")
-
-    # Opacity-driven conditions (may override if stronger)
-    # Implement requested cataract rules using brightness_mean (vb) and texture_index (tex)
-    vb = float(opencv_results.get('brightness_mean', 0.0))  # HSV-V mean [0,1]
-    tex = float(opencv_results.get('texture_index', 0.0))    # lap_norm [0,1], high=more texture
-    strong_opacity_case = False
-
-    # 1) Ultra-strong rule (prioritize even with glare)
-    if (o >= 0.88 and vb >= 0.70 and tex <= 0.015 and r <= 0.55 and cw >= 0.42):
-        diagnosis = 'cataracts'
-        strong_opacity_case = True
-        severity = 'severe' if (o >= 0.92 or cw >= 0.50) else 'moderate'
-        explanation_parts.append(
-            f"Patrón de iris muy blanqueado: opacidad {o:.2f}, brillo {vb:.2f}, textura baja {tex:.3f}, blancura central {cw:.2f}."
-        )
-    # 2) Strong rule (robust to moderate glare)
-    elif (o >= 0.82 and vb >= 0.62 and tex <= 0.020 and r < 0.62 and cw >= 0.35 and h < 0.06):
-        diagnosis = 'cataracts'
-        severity = 'severe' if (o >= 0.88 or cw >= 0.42) else 'moderate'
-        explanation_parts.append(
-            f"Opacidad alta ({o:.2f}), brillo {vb:.2f}, textura baja {tex:.3f}, blancura central {cw:.2f}."
-        )
-    # 3) Standard rule
-    elif (o >= 0.68 and vb >= 0.55 and h < 0.025 and r < 0.60 and cw >= 0.28 and tex <= 0.08):
-        diagnosis = 'cataracts'
-        severity = 'severe' if (o >= 0.78 or cw >= 0.35) else 'moderate'
-        explanation_parts.append(
-            f"Opacidad elevada ({o:.2f}), brillo {vb:.2f}, blancura central {cw:.2f} con poca textura {tex:.3f}."
-        )
-    # 4) Fallback by central whiteness + low texture
-    elif ((o >= 0.72 or cw >= 0.38) and vb >= 0.58 and r < 0.62 and tex <= 0.022):
-        diagnosis = 'cataracts'
-        severity = 'moderate'
-        explanation_parts.append(
-            f"Indicadores compatibles con cataratas: opacidad {o:.2f}/blancura {cw:.2f}, brillo {vb:.2f}, textura baja {tex:.3f}."
-        )
-    elif o >= opacity_minor_th and diagnosis == 'normal':
-        diagnosis = 'opacidades_menores'
-        severity = 'mild'
-        if h >= glare_high_th:
-            explanation_parts.append(f"Opacidad leve ({o:.2f}) con reflejos ({h*100:.1f}% zona brillante).")
-        else:
-            explanation_parts.append(f"Opacidad leve ({o:.2f}).")
-
-    # Confidence heuristic from distances to thresholds
-    conf_r = min(max((r - redness_minor_th) / (redness_conjunctivitis_th - redness_minor_th + 1e-6), 0), 1)
-    conf_o = min(max((o - opacity_minor_th) / (max(0.01, 0.78) - opacity_minor_th + 1e-6), 0), 1)
-    conf_w = min(max((cw - 0.20) / (max(0.21, whiteness_cataract_th) - 0.20 + 1e-6), 0), 1)
-    # Reduce redness contribution to confidence to make “rojo” less dominant
-    base_conf = 0.5 * conf_w + 0.40 * conf_o + 0.10 * conf_r
-    # Boost if both signals are strong
-    if r >= redness_conjunctivitis_th and o >= opacity_cataract_th:
-        base_conf = min(1.0, base_conf + 0.2)
-
-    # Penalize confidence if glare present (reduce impacto de reflejos)
-    if h >= glare_high_th:
-        # Penalización menor si la clasificación fue por opacidad muy alta
-        penalty = 0.05 if 'strong_opacity_case' in locals() and strong_opacity_case else 0.15
-        base_conf = max(0.0, base_conf - penalty)
-        explanation_parts.append(f"Detectamos reflejos fuertes ({h*100:.1f}% píxeles muy brillantes), ajustando confianza.")
-
-    # Co-findings: if primary is conjunctivitis, flag possible/likely cataracts based on opacity signals
-    if diagnosis == 'conjunctivitis':
-        if (o >= opacity_minor_th and v <= 0.28) or (cw >= whiteness_cataract_th) or (o >= 0.55 and h < glare_high_th):
-            level = 'likely' if (o >= opacity_cataract_th and v <= vascular_low_th) else 'possible'
-            co_findings.append({'label': 'cataracts', 'level': level, 'score': float(o)})
-            explanation_parts.append(
-                ("Además, se observan indicios compatibles con cataratas "
-                 f"(opacidad {o:.2f}{', blancura central alta' if cw >= whiteness_cataract_th else ''}).")
-            )
-    # If primary is cataracts, flag possible/likely conjunctivitis based on redness/vascular
-    if diagnosis == 'cataracts':
-        if r >= redness_minor_th and v >= vascular_elevated_th:
-            level = 'likely' if r >= redness_conjunctivitis_th else 'possible'
-            co_findings.append({'label': 'conjunctivitis', 'level': level, 'score': float(r)})
-            explanation_parts.append("Además, se aprecia rojez con incremento vascular compatibles con conjuntivitis.")
-
-    # Append a short metrics summary for traceability
-    explanation_parts.append(
-        f"[Métricas] opacidad={o:.2f}, bordes={v:.2f}, rojez={r:.2f}, blancura={cw:.2f}, reflejos={h:.2f}."
-    )
+        return float(_setting_or_env(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Analysis feature toggles from settings/env, resolved once per process (restart to change)
+_VC_ENABLE_TTA = _bool_setting('VC_ENABLE_TTA', '1')
+_VC_ENABLE_QUALITY = _bool_setting('VC_ENABLE_QUALITY', '1')
+_VC_P_CATARACT_HIGH = _float_setting('VC_P_CATARACT_HIGH', 0.75)
+_VC_P_CATARACT_MID = _float_setting('VC_P_CATARACT_MID', 0.55)
 
-    recommendations = []
-    if diagnosis == 'conjunctivitis':
-        recommendations.append("Higiene ocular, evitar frotar los ojos, lágrimas artificiales.")
-    if diagnosis == 'cataracts':
-        recommendations.append("Evaluación oftalmológica para valorar tratamiento.")
-    if diagnosis in ('opacidades_menores', 'redness_minor'):
-        recommendations.append("Monitoreo de síntomas; consulta si persisten o empeoran.")
-    if diagnosis == 'normal':
-        recommendations.append("Mantener hábitos saludables y controles periódicos si hay molestias.")
-
-    explanation = " ".join(explanation_parts) if explanation_parts else "Sin hallazgos relevantes según métricas calculadas."
-    return {
-        'diagnosis': diagnosis,
-        'severity': severity,
-        'confidence': float(max(0.0, min(1.0, base_conf))),
-        'explanation': explanation,
-        'recommendations': " ".join(recommendations),
-        'co_findings': co_findings,
-    }
 
 class AnalyzeImageView(APIView):
     """Main endpoint for analyzing eye images (Hexagonal delegation)."""
-    parser_classes = [MultiPartParser, FormParser]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -300,24 +209,15 @@ class AnalyzeImageView(APIView):
         serializer.is_valid(raise_exception=True)
         image_file = serializer.validated_data['image']
 
-        # Feature toggles from env/settings
-        from django.conf import settings as dj_settings
-        enable_tta = getattr(dj_settings, 'VC_ENABLE_TTA', os.getenv('VC_ENABLE_TTA', '1'))
-        enable_quality = getattr(dj_settings, 'VC_ENABLE_QUALITY', os.getenv('VC_ENABLE_QUALITY', '1'))
-        p_high = getattr(dj_settings, 'VC_P_CATARACT_HIGH', float(os.getenv('VC_P_CATARACT_HIGH', '0.75')))
-        p_mid = getattr(dj_settings, 'VC_P_CATARACT_MID', float(os.getenv('VC_P_CATARACT_MID', '0.55')))
-        enable_tta = str(enable_tta).strip() not in ('0', 'false', 'False', '')
-        enable_quality = str(enable_quality).strip() not in ('0', 'false', 'False', '')
-
         # Wire ports and use case
         use_case = get_analysis_use_case()
         result = use_case.execute(UploadAndAnalyzeInput(
             user_id=request.user.id,
             image_file=image_file,
-            enable_tta=enable_tta,
-            enable_quality=enable_quality,
-            p_high=float(p_high),
-            p_mid=float(p_mid),
+            enable_tta=_VC_ENABLE_TTA,
+            enable_quality=_VC_ENABLE_QUALITY,
+            p_high=_VC_P_CATARACT_HIGH,
+            p_mid=_VC_P_CATARACT_MID,
         ))
 
         analysis = result['record']
@@ -327,10 +227,6 @@ class AnalyzeImageView(APIView):
         }
         if result.get('processed_image_url'):
             resp['processed_image_url'] = result['processed_image_url']
-            try:
-                resp['analysis']['ai_raw_response']['processed_image_url'] = result['processed_image_url']
-            except Exception:
-                pass
         if result.get('uncertainty'):
             resp['uncertainty'] = result['uncertainty']
         if result.get('quality') is not None:
@@ -342,13 +238,36 @@ class AnalyzeImageView(APIView):
         return Response(resp, status=status.HTTP_201_CREATED)
     
 
+class HistoryPagination(PageNumberPagination):
+    """Opt-in history paging: only when the client sends ``page`` or ``page_size``.
+
+    Without either parameter the full list is returned as a plain array, which is
+    what the history screen expects (it never follows ``next``).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.page_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
 class AnalysisHistoryView(generics.ListAPIView):
     """Get user's analysis history"""
     serializer_class = AnalysisHistorySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = HistoryPagination
     
     def get_queryset(self):
-        return Analysis.objects.filter(user=self.request.user)
+        # Load only the columns the history rows render and extract the preview URL
+        # in the database instead of fetching the whole ai_raw_response JSON per row
+        return (
+            Analysis.objects.filter(user=self.request.user)
+            .only('id', 'image', 'diagnosis', 'severity', 'confidence_score', 'created_at')
+            .annotate(preview_url=KeyTextTransform('processed_image_url', 'ai_raw_response'))
+        )
 
 class AnalysisDetailView(generics.RetrieveAPIView):
     """Get detailed analysis results"""
@@ -356,7 +275,8 @@ class AnalysisDetailView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Analysis.objects.filter(user=self.request.user)
+        # The raw model payload is not part of the detail response
+        return Analysis.objects.filter(user=self.request.user).select_related('user').defer('ai_raw_response')
 
 class ClearHistoryView(APIView):
     """Delete all analysis history for the authenticated user (temporary utility)."""
@@ -376,83 +296,193 @@ class ClearHistoryView(APIView):
         supabase_client = None
         if storage_kind in ('supabase', 'supabase_storage'):
             try:
-                import os as _os
-                from .adapters.storage.supabase_common import create_supabase_client  # type: ignore
-                supabase_bucket = _os.getenv('VC_PREVIEWS_BUCKET', 'eye-previews')
-                supabase_client = create_supabase_client()
+                supabase_client, supabase_bucket = get_previews_supabase()
             except Exception:
                 supabase_client = None
 
-        def _delete_processed_preview(preview_url: str):
-            if not preview_url:
+        def _delete_processed_previews(preview_urls):
+            if not preview_urls:
                 return
             try:
                 if storage_kind in ('supabase', 'supabase_storage') and supabase_client and supabase_bucket:
                     # Expected shape: {SUPABASE_URL}/storage/v1/object/public/<bucket>/<path>
-                    token = '/storage/v1/object/public/'
-                    path = None
-                    if token in preview_url:
-                        try:
-                            after = preview_url.split(token, 1)[1]
-                            # after = '<bucket>/<path>'
-                            parts = after.split('/', 1)
-                            if len(parts) == 2:
-                                bucket_in_url, rest = parts
-                                if bucket_in_url == supabase_bucket:
-                                    path = rest
-                        except Exception:
-                            path = None
-                    # If path is still None, skip silently (foreign URL)
-                    if path:
+                    paths = []
+                    for preview_url in preview_urls:
+                        _, sep, tail = preview_url.partition('/storage/v1/object/public/')
+                        if not sep:
+                            continue
+                        bucket_in_url, _, path = tail.partition('/')
+                        # Foreign bucket or empty path: skip silently
+                        if bucket_in_url == supabase_bucket and path:
+                            paths.append(path)
+                    if paths:
+                        # Storage API accepts a list: one request for the whole history
                         try:
-                            supabase_client.storage.from_(supabase_bucket).remove([path])
+                            supabase_client.storage.from_(supabase_bucket).remove(paths)
                         except Exception:
                             pass
                 else:
                     # Media storage: remove file if under MEDIA_URL
                     base = str(media_url)
-                    url = str(preview_url)
-                    idx = url.find(base)
-                    if idx != -1 and media_root:
-                        rel = url[idx + len(base):].lstrip('/')
-                        import os as _os
-                        abs_path = _os.path.join(media_root, rel)
-                        try:
-                            if _os.path.exists(abs_path):
-                                _os.remove(abs_path)
-                        except Exception:
-                            pass
+                    for preview_url in preview_urls:
+                        url = str(preview_url)
+                        idx = url.find(base)
+                        if idx != -1 and media_root:
+                            rel = url[idx + len(base):].lstrip('/')
+                            abs_path = os.path.join(media_root, rel)
+                            try:
+                                if os.path.exists(abs_path):
+                                    os.remove(abs_path)
+                            except Exception:
+                                pass
             except Exception:
                 # Never fail whole request because of cleanup
                 pass
 
-        # Delete associated files safely, then delete DB rows
+        # Collect file references first, then delete files in batches and the rows
+        # with a single DELETE (FileField.delete would issue one storage call each).
+        # The preview URL is extracted by the database (JSON key path) so the whole
+        # ai_raw_response blob is never transferred or decoded.
         deleted = 0
-        for analysis in qs.iterator():
-            # Remove uploaded image file
-            try:
-                if getattr(analysis, 'image', None):
-                    analysis.image.delete(save=False)
-            except Exception:
-                pass
-            # Remove processed preview if any
+        image_names = []
+        preview_urls = []
+        for preview, image_name in qs.values_list('ai_raw_response__processed_image_url', 'image'):
+            deleted += 1
+            if image_name:
+                image_names.append(image_name)
+            if isinstance(preview, str) and preview:
+                preview_urls.append(preview)
+
+        # Remove uploaded image files
+        if image_names:
             try:
-                raw = getattr(analysis, 'ai_raw_response', None) or {}
-                preview = raw.get('processed_image_url') if isinstance(raw, dict) else None
-                if isinstance(preview, str) and preview:
-                    _delete_processed_preview(preview)
+                delete_many = getattr(default_storage, 'delete_many', None)
+                if delete_many is not None:
+                    delete_many(image_names)
+                else:
+                    for name in image_names:
+                        default_storage.delete(name)
             except Exception:
                 pass
-            deleted += 1
+        # Remove processed previews if any
+        _delete_processed_previews(preview_urls)
         # Bulk delete rows
         qs.delete()
         return Response({'message': 'Historial eliminado correctamente', 'deleted': deleted}, status=status.HTTP_200_OK)
 
+# Choice labels for the report (get_FOO_display rebuilds the choices dict per call)
+_DIAG_LABELS = dict(Analysis.DIAGNOSIS_CHOICES)
+_SEV_LABELS = dict(Analysis.SEVERITY_CHOICES)
+
+
+@lru_cache(maxsize=1)
+def _pdf_report_styles():
+    """Paragraph styles and (blue, teal, green) table styles for the PDF report.
+
+    ReportLab is imported here rather than at module load so workers that never
+    render a report don't pay for it; the styles are built once per process and
+    shared read-only by every request.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import TableStyle
+
+    styles = getSampleStyleSheet()
+    styles['Title'].fontSize = 20
+    styles['Title'].leading = 24
+    styles['Heading2'].spaceBefore = 12
+    styles['Heading2'].spaceAfter = 6
+
+    def table_style(header_bg, header_text=colors.whitesmoke):
+        return TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), header_bg),
+            ('TEXTCOLOR', (0,0), (-1,0), header_text),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0,0), (-1,0), 11),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ('VALIGN', (0,0), (-1,-1), 'TOP'),
+            ('INNERGRID', (0,0), (-1,-1), 0.5, colors.grey),
+            ('BOX', (0,0), (-1,-1), 0.75, colors.grey),
+            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.whitesmoke, colors.Color(0.97,0.97,0.99)])
+        ])
+
+    return (
+        styles,
+        table_style(colors.Color(0.15,0.25,0.55)),
+        table_style(colors.Color(0.05,0.45,0.65)),
+        table_style(colors.Color(0.25,0.45,0.15)),
+    )
+
+_RE_ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+@lru_cache(maxsize=1)
+def _report_logo():
+    """Header logo decoded once per process, or None when no logo file is present.
+
+    ImageReader decodes lazily; the decode is forced here, under the cache, so the
+    shared reader is read-only by the time concurrent PDF requests draw it.
+    """
+    from reportlab.lib.utils import ImageReader
+
+    public_dir = os.path.join(settings.BASE_DIR, 'frontend', 'public')
+    for name in ('logo-eye.png', 'Logo_inicio.png'):
+        path = os.path.join(public_dir, name)
+        if os.path.exists(path):
+            try:
+                reader = ImageReader(path)
+                reader.getSize()
+                reader.getRGBData()
+                reader.getTransparent()
+                return reader
+            except Exception:
+                return None
+    return None
+
+
+def _analysis_pdf_etag(analysis, gzipped=False):
+    """ETag for an analysis report: changes when the analysis or its user is updated.
+
+    Weak, because each render stamps the generation time into the PDF, and distinct
+    per content-coding so the gzip and identity bodies never share a validator.
+    """
+    user = analysis.user
+    raw = f"{analysis.id}:{analysis.updated_at.timestamp()}:{user.pk}:{user.updated_at.timestamp()}"
+    return 'W/"%s%s"' % (hashlib.sha1(raw.encode()).hexdigest(), '-gzip' if gzipped else '')
+
+
+def _etag_matches(if_none_match, etag):
+    """Weak comparison (RFC 9110 If-None-Match) of ``etag`` against the header value."""
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for tag in parse_etags(if_none_match):
+        if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == opaque:
+            return True
+    return False
+
+
+def _gzip_file_chunks(fileobj, blksize=64 * 1024):
+    """Yield gzip-compressed chunks of ``fileobj`` and close it once exhausted."""
+    try:
+        yield from compress_sequence(FileWrapper(fileobj, blksize=blksize))
+    finally:
+        fileobj.close()
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def download_analysis_pdf(request, analysis_id):
     """Generate and download a professional PDF report for an analysis with branding and extended metrics."""
-    analysis = get_object_or_404(Analysis, id=analysis_id, user=request.user)
+    analysis = get_object_or_404(Analysis.objects.select_related('user'), id=analysis_id, user=request.user)
+
+    # Reports only change when the analysis or the patient data change: let clients
+    # revalidate with If-None-Match and skip rendering entirely on a match
+    use_gzip = bool(_RE_ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    etag = _analysis_pdf_etag(analysis, gzipped=use_gzip)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and _etag_matches(if_none_match, etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response['ETag'] = etag
+        return response
 
     # Extract extra (runtime / uncertainty / quality) if present in ai_raw_response
     ai_raw = getattr(analysis, 'ai_raw_response', None) or {}
@@ -461,7 +491,13 @@ def download_analysis_pdf(request, analysis_id):
     quality = ai_raw.get('quality') or {}
     runtime = ai_raw.get('runtime') or {}
 
-    buffer = BytesIO()
+    # Render into a spooled file (RAM up to 512KB, then disk) and stream it back in
+    # chunks instead of copying the whole document out of a BytesIO
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+
+    buffer = SpooledTemporaryFile(max_size=512 * 1024)
     doc = SimpleDocTemplate(
         buffer,
         pagesize=letter,
@@ -471,26 +507,12 @@ def download_analysis_pdf(request, analysis_id):
         bottomMargin=60,
         title="Reporte VisionCare"
     )
-    styles = getSampleStyleSheet()
-    styles['Title'].fontSize = 20
-    styles['Title'].leading = 24
-    styles['Heading2'].spaceBefore = 12
-    styles['Heading2'].spaceAfter = 6
+    styles, tbl_style_blue, tbl_style_teal, tbl_style_green = _pdf_report_styles()
     story = []
 
-    def build_table(data, header_bg=colors.Color(0.15,0.25,0.55), header_text=colors.whitesmoke):
+    def build_table(data, style=tbl_style_blue):
         tbl = Table(data, colWidths=[160, 330])
-        tbl.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), header_bg),
-            ('TEXTCOLOR', (0,0), (-1,0), header_text),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,0), 11),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('VALIGN', (0,0), (-1,-1), 'TOP'),
-            ('INNERGRID', (0,0), (-1,-1), 0.5, colors.grey),
-            ('BOX', (0,0), (-1,-1), 0.75, colors.grey),
-            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.whitesmoke, colors.Color(0.97,0.97,0.99)])
-        ]))
+        tbl.setStyle(style)
         return tbl
 
     story.append(Paragraph("Reporte de Análisis VisionCare", styles['Title']))
@@ -518,8 +540,8 @@ def download_analysis_pdf(request, analysis_id):
     vascular = analysis.opencv_vascular_density
     results_rows = [
         ["RESULTADOS DEL MODELO", ""],
-        ["Diagnóstico principal", analysis.get_diagnosis_display()],
-        ["Severidad", analysis.get_severity_display()],
+        ["Diagnóstico principal", _DIAG_LABELS.get(analysis.diagnosis, analysis.diagnosis)],
+        ["Severidad", _SEV_LABELS.get(analysis.severity, analysis.severity)],
         ["Confianza (clasificador)", f"{analysis.confidence_score:.2%}"],
         ["Rojez (OpenCV)", f"{analysis.opencv_redness_score:.3f}"],
         ["Opacidad (OpenCV)", f"{analysis.opencv_opacity_score:.3f}"],
@@ -528,7 +550,7 @@ def download_analysis_pdf(request, analysis_id):
         results_rows.append(["Densidad vascular (OpenCV)", f"{vascular:.3f}"])
     if isinstance(cataracts_prob, (int,float)):
         results_rows.append(["Prob. de cataratas (ONNX)", f"{cataracts_prob:.2%}"])
-    story.append(build_table(results_rows, header_bg=colors.Color(0.05,0.45,0.65)))
+    story.append(build_table(results_rows, style=tbl_style_teal))
     story.append(Spacer(1, 16))
 
     extra_sections = []
@@ -554,7 +576,7 @@ def download_analysis_pdf(request, analysis_id):
         if runtime.get('providers'):
             extra_sections.append(["Proveedores", ', '.join(runtime.get('providers', []))])
     if extra_sections:
-        story.append(build_table([["MÉTRICAS ADICIONALES",""], *extra_sections[1:]], header_bg=colors.Color(0.25,0.45,0.15)))
+        story.append(build_table([["MÉTRICAS ADICIONALES",""], *extra_sections[1:]], style=tbl_style_green))
         story.append(Spacer(1, 16))
 
     if analysis.ai_analysis_text:
@@ -572,16 +594,14 @@ def download_analysis_pdf(request, analysis_id):
 
     story.append(Paragraph("<b>Descargo de responsabilidad:</b> Este reporte es generado automáticamente y no sustituye una evaluación clínica presencial. Ante síntomas persistentes consulte a un profesional de la salud.", styles['Normal']))
 
-    logo_path = os.path.join(settings.BASE_DIR, 'frontend', 'public', 'logo-eye.png')
-    alt_logo_path = os.path.join(settings.BASE_DIR, 'frontend', 'public', 'Logo_inicio.png')
+    logo = _report_logo()
     def _header_footer(c, doc_obj):
         c.saveState()
         c.setFillColorRGB(0.05,0.25,0.55)
         c.rect(0, letter[1]-70, letter[0], 70, fill=1, stroke=0)
-        img_used = logo_path if os.path.exists(logo_path) else (alt_logo_path if os.path.exists(alt_logo_path) else None)
-        if img_used:
+        if logo:
             try:
-                c.drawImage(img_used, 40, letter[1]-62, width=60, height=54, preserveAspectRatio=True, mask='auto')
+                c.drawImage(logo, 40, letter[1]-62, width=60, height=54, preserveAspectRatio=True, mask='auto')
             except Exception:
                 pass
         c.setFillColor(colors.whitesmoke)
@@ -596,8 +616,21 @@ def download_analysis_pdf(request, analysis_id):
 
     doc.build(story, onFirstPage=_header_footer, onLaterPages=_header_footer)
     buffer.seek(0)
-    response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="visioncare_analysis_{analysis.id}.pdf"'
+    if use_gzip:
+        # Page streams are already Flate-compressed, but fonts/xref still shrink ~30%
+        response = StreamingHttpResponse(_gzip_file_chunks(buffer), content_type='application/pdf')
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Disposition'] = f'attachment; filename="visioncare_analysis_{analysis.id}.pdf"'
+    else:
+        # FileResponse sets Content-Length/Disposition and closes the spooled file when done
+        response = FileResponse(
+            buffer, as_attachment=True, filename=f'visioncare_analysis_{analysis.id}.pdf',
+            content_type='application/pdf',
+        )
+        response.block_size = 64 * 1024
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=3600'
     return response
 
 @api_view(['GET'])
@@ -24,6 +24,12 @@ def _csv_env(name: str, default_list: list[str] | None = None) -> list[str]:
 def _bool_env(name: str, default: bool) -> bool:
     return str(os.getenv(name, '1' if default else '0')).strip().lower() in ('1', 'true', 'yes')
 
+def _float_env(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-visioncare-secret-key-change-in-production')
 
@@ -129,7 +135,6 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.MultiPartParser',
-        'rest_framework.parsers.FileUploadParser',
     ]
 }
 
@@ -258,8 +263,8 @@ LOGGING = {
 # Default model directory inside app; can be overridden with VC_ONNX_MODEL(S)
 VC_ONNX_DEFAULT_DIR = os.path.join(BASE_DIR, 'vision_app', 'onnx_models')
 # Fusion thresholds for cataract probability
-VC_P_CATARACT_HIGH = float(os.getenv('VC_P_CATARACT_HIGH', '0.75'))
-VC_P_CATARACT_MID = float(os.getenv('VC_P_CATARACT_MID', '0.55'))
+VC_P_CATARACT_HIGH = _float_env('VC_P_CATARACT_HIGH', 0.75)
+VC_P_CATARACT_MID = _float_env('VC_P_CATARACT_MID', 0.55)
 
 # Base site URL for building absolute links (used by adapters)
 SITE_URL = os.getenv('SITE_URL', '').strip()